@@ -2,19 +2,29 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from dataclasses import dataclass, astuple
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
 import math
+import bisect
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 import io
-from datetime import datetime
+import hashlib
+from datetime import date, datetime
+
+# ================== COSTANTI ELETTRICHE ==================
+_SQRT3 = math.sqrt(3.0)
+_V_LINE = 400.0  # tensione concatenata BT (V)
+_K_CURRENT = 1000.0 / (_V_LINE * _SQRT3)  # I = P[kW] * _K_CURRENT / cos φ
+
+# Taglie standard trasformatori MT/BT (kVA), ordinate
+_TRASF_STD = (160, 250, 315, 400, 500, 630, 800, 1000, 1250, 1600, 2000, 2500)
 
 # ================== DATA STRUCTURES ==================
-@dataclass
+@dataclass(frozen=True)
 class Carico:
     nome: str
     potenza_kw: float
@@ -30,57 +40,165 @@ class Interruttore:
     in_nominale: int
     potere_interruzione: int
     prezzo: float
+
+# Regime e priorità hanno pochi valori ammessi: categorie (codici int8) invece di stringhe
+_REGIME_DTYPE = pd.CategoricalDtype(["continuo", "intermittente"])
+_PRIORITA_DTYPE = pd.CategoricalDtype(["critico", "normale", "differibile"])
+
+# Colonne della tabella carichi in session_state, nello stesso ordine dei campi di Carico
+_COLONNE_CARICHI = ["nome", "potenza_kw", "cos_phi", "regime", "priorita", "ore_giorno"]
+_DTYPE_CARICHI = {"nome": object, "potenza_kw": "float64", "cos_phi": "float64",
+                  "regime": _REGIME_DTYPE, "priorita": _PRIORITA_DTYPE, "ore_giorno": "float64"}
+
+def tabella_carichi(carichi: Iterable[Carico] = ()) -> pd.DataFrame:
+    """Tabella colonnare dei carichi (una riga per Carico)"""
+    tabella = pd.DataFrame.from_records([astuple(c) for c in carichi], columns=_COLONNE_CARICHI)
+    # astype trasformerebbe in NaN i valori fuori categoria: segnalarli prima
+    for col, dtype in (("regime", _REGIME_DTYPE), ("priorita", _PRIORITA_DTYPE)):
+        ignoti = ~tabella[col].isin(dtype.categories)
+        if ignoti.any():
+            raise ValueError(f"Valori di {col} non ammessi: {sorted(set(tabella.loc[ignoti, col].astype(str)))}")
+    return tabella.astype(_DTYPE_CARICHI)
+
+def aggiungi_carichi(carichi: pd.DataFrame, nuovi: Iterable[Carico]) -> pd.DataFrame:
+    """Nuova tabella con i carichi accodati (la tabella esistente non viene modificata)"""
+    nuovi = tabella_carichi(nuovi)
+    if carichi.empty:  # evita il concat con tabella vuota (dtype ambigui)
+        return nuovi
+    return pd.concat([carichi, nuovi], ignore_index=True)
+
+def _tabella_da_key(carichi_key: Tuple[Tuple, ...]) -> pd.DataFrame:
+    """Tabella dei carichi ricostruita dalla chiave hashable delle funzioni memoizzate"""
+    return pd.DataFrame.from_records(carichi_key, columns=_COLONNE_CARICHI)
+
+class ProgettoCalcoli(NamedTuple):
+    pot_inst: float
+    fatt_cont: float
+    pot_dim: float
+    trasf_scelto: Optional[int]  # None se pot_dim supera la taglia massima
+    icc: Optional[float]
+    verifica_term: Dict
     
+# ================== TEMPLATE CARICHI ==================
+# Tuple immutabili di Carico (frozen): condivise tra sessioni senza copie
+_TEMPLATE_OFFICINA = (
+    Carico("Centro CNC 1", 45, 0.85, "continuo", "normale", 16),
+    Carico("Centro CNC 2", 35, 0.85, "continuo", "normale", 16),
+    Carico("Tornio", 15, 0.8, "intermittente", "normale", 8),
+    Carico("Compressore", 22, 0.85, "continuo", "critico", 24),
+    Carico("Illuminazione", 15, 0.9, "continuo", "normale", 12),
+)
+
+_TEMPLATE_CASEIFICIO = (
+    Carico("Pastorizzatore", 120, 0.9, "continuo", "critico", 24),
+    Carico("Gruppo Frigo", 85, 0.85, "continuo", "critico", 24),
+    Carico("Centrifuga", 75, 0.8, "intermittente", "normale", 6),
+    Carico("Confezionamento", 35, 0.85, "continuo", "normale", 16),
+)
+
 # ================== DATABASE COMPONENTI ==================
-@st.cache_data
-def load_interruttori_db() -> pd.DataFrame:
-    return pd.DataFrame([
-        {"serie": "T1", "modello": "T1S160", "in_nom": 63, "icu": 15, "prezzo": 450},
-        {"serie": "T1", "modello": "T1S160", "in_nom": 80, "icu": 15, "prezzo": 520},
-        {"serie": "T2", "modello": "T2S160", "in_nom": 100, "icu": 25, "prezzo": 680},
-        {"serie": "T2", "modello": "T2S160", "in_nom": 125, "icu": 25, "prezzo": 750},
-        {"serie": "T3", "modello": "T3S250", "in_nom": 160, "icu": 35, "prezzo": 950},
-        {"serie": "T3", "modello": "T3S250", "in_nom": 200, "icu": 35, "prezzo": 1100},
-        {"serie": "T4", "modello": "T4S250", "in_nom": 250, "icu": 50, "prezzo": 1450},
-        {"serie": "T5", "modello": "T5H400", "in_nom": 320, "icu": 65, "prezzo": 2200},
-        {"serie": "T5", "modello": "T5H400", "in_nom": 400, "icu": 65, "prezzo": 2800},
-        {"serie": "E1", "modello": "E1N800", "in_nom": 630, "icu": 42, "prezzo": 4500},
-        {"serie": "E1", "modello": "E1N800", "in_nom": 800, "icu": 42, "prezzo": 5200},
-        {"serie": "E2", "modello": "E2N1250", "in_nom": 1000, "icu": 65, "prezzo": 7800},
-        {"serie": "E3", "modello": "E3N1600", "in_nom": 1250, "icu": 65, "prezzo": 12000},
-        {"serie": "E3", "modello": "E3N3200", "in_nom": 1600, "icu": 65, "prezzo": 15000},
-    ])
+# Dati statici: costruiti una volta all'import, nessun lookup di cache per rerun.
+# Prezzo non decrescente con in_nom (vedi seleziona_interruttori)
+_INTERRUTTORI_DF = pd.DataFrame([
+    {"serie": "T1", "modello": "T1S160", "in_nom": 63, "icu": 15, "prezzo": 450},
+    {"serie": "T1", "modello": "T1S160", "in_nom": 80, "icu": 15, "prezzo": 520},
+    {"serie": "T2", "modello": "T2S160", "in_nom": 100, "icu": 25, "prezzo": 680},
+    {"serie": "T2", "modello": "T2S160", "in_nom": 125, "icu": 25, "prezzo": 750},
+    {"serie": "T3", "modello": "T3S250", "in_nom": 160, "icu": 35, "prezzo": 950},
+    {"serie": "T3", "modello": "T3S250", "in_nom": 200, "icu": 35, "prezzo": 1100},
+    {"serie": "T4", "modello": "T4S250", "in_nom": 250, "icu": 50, "prezzo": 1450},
+    {"serie": "T5", "modello": "T5H400", "in_nom": 320, "icu": 65, "prezzo": 2200},
+    {"serie": "T5", "modello": "T5H400", "in_nom": 400, "icu": 65, "prezzo": 2800},
+    {"serie": "E1", "modello": "E1N800", "in_nom": 630, "icu": 42, "prezzo": 4500},
+    {"serie": "E1", "modello": "E1N800", "in_nom": 800, "icu": 42, "prezzo": 5200},
+    {"serie": "E2", "modello": "E2N1250", "in_nom": 1000, "icu": 65, "prezzo": 7800},
+    {"serie": "E3", "modello": "E3N1600", "in_nom": 1250, "icu": 65, "prezzo": 12000},
+    {"serie": "E3", "modello": "E3N3200", "in_nom": 1600, "icu": 65, "prezzo": 15000},
+])
+
+# Catalogo come array NumPy ordinati per in_nom, estratti una volta all'import
+_CATALOGO = _INTERRUTTORI_DF.sort_values('in_nom', kind='stable', ignore_index=True)
+_BREAKER_IN_NOM = _CATALOGO['in_nom'].to_numpy(dtype=np.int32)
+_BREAKER_ICU = _CATALOGO['icu'].to_numpy(dtype=np.int32)
+_BREAKER_PREZZO = _CATALOGO['prezzo'].to_numpy(dtype=np.float32)
+_BREAKER_MODELLO = _CATALOGO['modello'].to_numpy(dtype=object)
+_BREAKER_RECORDS = _CATALOGO.to_dict('records')
+# seleziona_interruttori prende il primo adeguato come più economico: richiede prezzi non decrescenti
+if (np.diff(_BREAKER_PREZZO) < 0).any():
+    raise ValueError("Catalogo interruttori: il prezzo deve essere non decrescente con in_nom")
 
 # ================== CALCOLI INGEGNERISTICI ==================
-def calcola_potenza_dimensionamento(carichi: List[Carico]) -> Tuple[float, float, float]:
+def prossimo_standard(valori: Tuple[float, ...], x: float) -> Optional[float]:
+    """Più piccolo valore standard >= x (valori ordinati); None se x supera l'ultimo"""
+    i = bisect.bisect_left(valori, x)
+    return valori[i] if i < len(valori) else None
+
+# Peso di contemporaneità per regime, allineato a _REGIME_DTYPE.categories:
+# parte fissa + parte proporzionale alle ore/giorno
+_PESO_FISSO_REGIME = np.array([1.0, 0.0])        # continuo, intermittente
+_PESO_ORARIO_REGIME = np.array([0.0, 0.7 / 24])  # continuo, intermittente
+
+def calcola_potenza_dimensionamento(carichi: pd.DataFrame) -> Tuple[float, float, float]:
     """Calcola potenza installata, contemporaneità e dimensionamento"""
-    pot_installata = sum(c.potenza_kw for c in carichi)
+    pot = carichi['potenza_kw'].to_numpy()
+    ore = carichi['ore_giorno'].to_numpy()
+    codici = carichi['regime'].astype(_REGIME_DTYPE).cat.codes.to_numpy()
+    if (codici < 0).any():  # codice -1: regime non ammesso (o mancante)
+        raise ValueError(f"Regime non ammesso: {sorted(set(carichi['regime'][codici < 0].astype(str)))}")
     
-    # Fattore contemporaneità intelligente basato su tipo carichi
-    carichi_continui = [c for c in carichi if c.regime == "continuo"]
-    carichi_intermittenti = [c for c in carichi if c.regime == "intermittente"]
+    pot_installata = float(pot.sum())
+    if pot_installata <= 0:
+        return 0.0, 0.0, 0.0
     
-    pot_continua = sum(c.potenza_kw for c in carichi_continui)
-    pot_intermittente = sum(c.potenza_kw * (c.ore_giorno/24) for c in carichi_intermittenti)
+    # Fattore contemporaneità intelligente basato su tipo carichi:
+    # peso 1 per i continui, 0.7 * ore/24 per gli intermittenti
+    peso = _PESO_FISSO_REGIME[codici] + _PESO_ORARIO_REGIME[codici] * ore
     
-    fattore_contemporaneita = min(0.9, (pot_continua + pot_intermittente*0.7) / pot_installata)
+    inv_pot = 1.0 / pot_installata
+    fattore_contemporaneita = min(0.9, float((pot * peso).sum()) * inv_pot)
     pot_dimensionamento = pot_installata * fattore_contemporaneita * 1.15  # +15% riserva
     
     return pot_installata, fattore_contemporaneita, pot_dimensionamento
 
+@st.cache_data
+def _calc_potenza(carichi_key: Tuple[Tuple, ...]) -> Tuple[float, float, float]:
+    """Versione memoizzata di calcola_potenza_dimensionamento, chiave = righe dei carichi"""
+    return calcola_potenza_dimensionamento(_tabella_da_key(carichi_key))
+
+def calcola_correnti(pot: np.ndarray, cos_phi: np.ndarray) -> np.ndarray:
+    """Correnti nominali di tutti i carichi (A) in un'unica operazione vettoriale"""
+    return pot * _K_CURRENT / cos_phi
+
+@st.cache_data
 def calcola_corrente_cortocircuito(potenza_trasf_kva: float, tensione: int = 400) -> float:
     """Calcola Icc semplificata"""
     sn_mva = potenza_trasf_kva / 1000
-    return (sn_mva * 1000) / (1.732 * tensione * 0.06)  # Zcc = 6%
+    return (sn_mva * 1000) / (_SQRT3 * tensione * 0.06)  # Zcc = 6%
 
-def seleziona_interruttore(corrente_richiesta: float, icc: float, db: pd.DataFrame) -> Dict:
+def seleziona_interruttore(corrente_richiesta: float, icc: float) -> Dict:
     """Seleziona interruttore ottimale"""
-    candidati = db[(db['in_nom'] >= corrente_richiesta * 1.25) & (db['icu'] >= icc)]
-    if candidati.empty:
+    mask = (_BREAKER_IN_NOM >= corrente_richiesta * 1.25) & (_BREAKER_ICU >= icc)
+    if not mask.any():
         return {"errore": "Nessun interruttore adeguato trovato"}
     
-    ottimale = candidati.loc[candidati['prezzo'].idxmin()]
-    return ottimale.to_dict()
+    idx = np.flatnonzero(mask)
+    return dict(_BREAKER_RECORDS[idx[np.argmin(_BREAKER_PREZZO[mask])]])
+
+def seleziona_interruttori(correnti: np.ndarray, icc: float) -> np.ndarray:
+    """Seleziona gli interruttori ottimali per tutte le partenze in un colpo solo.
+    
+    Restituisce, per ogni corrente, l'indice nel catalogo dell'interruttore
+    più economico adeguato, oppure -1 se nessuno è adeguato. Sfrutta
+    l'ordinamento del catalogo (in_nom crescente, prezzo non decrescente):
+    il più economico è il primo con Icu sufficiente e In >= 1.25 * I.
+    """
+    ammessi = np.flatnonzero(_BREAKER_ICU >= icc)
+    if ammessi.size == 0:
+        return np.full(correnti.shape[0], -1, dtype=np.int64)
+    
+    pos = np.searchsorted(_BREAKER_IN_NOM[ammessi], correnti * 1.25, side='left')
+    trovati = pos < ammessi.size
+    return np.where(trovati, ammessi[np.minimum(pos, ammessi.size - 1)], -1)
 
 def verifica_termica_semplificata(pot_dissipata: float, volume_m3: float, ip_grade: str) -> Dict:
     """Verifica termica CEI 17-43 semplificata CORRETTA"""
@@ -100,15 +218,86 @@ def verifica_termica_semplificata(pot_dissipata: float, volume_m3: float, ip_gra
         "esito": "OK" if margine > 20 else "CRITICO" if margine > 0 else "NON OK"
     }
 
-def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi, 
-                     pot_inst, fatt_cont, pot_dim, trasf_scelto, icc, verifica_term):
-    """Genera PDF professionale del progetto - Versione Premium"""
-    
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
-                           topMargin=72, bottomMargin=72)
-    
-    # Stili professionali
+# ================== STILI PDF ==================
+# Comandi statici: costruiti una sola volta all'import e riusati da ogni report
+# Tabelle chiave/valore (informazioni generali, trasformatore)
+_TABLE_STYLE_DATI = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+])
+
+# Tabelle con riga di intestazione (potenze, verifiche)
+_TABLE_STYLE_INTESTAZIONE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+])
+
+# Tabella caratteristiche costruttive
+_TABLE_STYLE_QUADRO = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('BACKGROUND', (0, 1), (0, -1), colors.lightgrey),
+])
+
+# Tabella elenco carichi con riga totale
+_TABLE_STYLE_CARICHI = TableStyle([
+    # Header
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 9),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    # Data
+    ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -2), 8),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('ALIGN', (1, 1), (1, -1), 'LEFT'),  # Nome carico allineato a sinistra
+    # Totale
+    ('BACKGROUND', (0, -1), (-1, -1), colors.darkgrey),
+    ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, -1), (-1, -1), 9),
+    # Bordi
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 4),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+])
+
+@st.cache_resource
+def _pdf_styles() -> Dict[str, ParagraphStyle]:
+    """Stili paragrafo del report, senza parametri: costruiti una sola volta"""
     styles = getSampleStyleSheet()
     
     # Stile titolo principale
@@ -145,6 +334,44 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
                                  textColor=colors.black,
                                  fontName='Helvetica')
     
+    # Stile footer
+    footer_style = ParagraphStyle('Footer', 
+                                 parent=styles['Normal'], 
+                                 fontSize=8, 
+                                 textColor=colors.grey,
+                                 fontName='Helvetica',
+                                 alignment=1)  # Centrato
+    
+    return {
+        'title': title_style,
+        'section': section_style,
+        'subsection': subsection_style,
+        'normal': normal_style,
+        'footer': footer_style,
+    }
+
+def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi, correnti,
+                     pot_inst, fatt_cont, pot_dim, trasf_scelto, icc, verifica_term,
+                     stili=None):
+    """Genera PDF professionale del progetto - Versione Premium
+    
+    `carichi` è la tabella colonnare dei carichi (vedi tabella_carichi).
+    `stili` sono gli stili paragrafo di _pdf_styles (letti qui se omessi).
+    """
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
+                           topMargin=72, bottomMargin=72)
+    
+    # Stili professionali (condivisi tra i report)
+    if stili is None:
+        stili = _pdf_styles()
+    title_style = stili['title']
+    section_style = stili['section']
+    subsection_style = stili['subsection']
+    normal_style = stili['normal']
+    footer_style = stili['footer']
+    
     # Contenuto PDF
     story = []
     
@@ -172,19 +399,7 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
     ]
     
     table_generale = Table(data_generale, colWidths=[2.5*inch, 3.5*inch])
-    table_generale.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-    ]))
+    table_generale.setStyle(_TABLE_STYLE_DATI)
     
     story.append(table_generale)
     story.append(Spacer(1, 25))
@@ -200,24 +415,11 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
         ['Potenza elettrica installata', f"{pot_inst:.0f}", 'kW'],
         ['Fattore di contemporaneità', f"{fatt_cont:.3f}", '-'],
         ['Potenza di dimensionamento', f"{pot_dim:.0f}", 'kW'],
-        ['Corrente nominale generale', f"{pot_dim * 1000 / (400 * 1.732 * 0.85):.0f}", 'A'],
+        ['Corrente nominale generale', f"{pot_dim * _K_CURRENT / 0.85:.0f}", 'A'],
     ]
     
     table_potenze = Table(data_potenze, colWidths=[3*inch, 1.5*inch, 1.5*inch])
-    table_potenze.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-    ]))
+    table_potenze.setStyle(_TABLE_STYLE_INTESTAZIONE)
     
     story.append(table_potenze)
     story.append(Spacer(1, 15))
@@ -235,19 +437,7 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
     ]
     
     table_trasf = Table(data_trasf, colWidths=[3*inch, 2*inch])
-    table_trasf.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-    ]))
+    table_trasf.setStyle(_TABLE_STYLE_DATI)
     
     story.append(table_trasf)
     story.append(Spacer(1, 25))
@@ -283,20 +473,7 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
     ]
     
     table_verifiche = Table(data_verifiche, colWidths=[2*inch, 2*inch, 2*inch])
-    table_verifiche.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-    ]))
+    table_verifiche.setStyle(_TABLE_STYLE_INTESTAZIONE)
     
     story.append(table_verifiche)
     story.append(Spacer(1, 25))
@@ -316,22 +493,7 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
     ]
     
     table_quadro = Table(data_quadro, colWidths=[2.5*inch, 3.5*inch])
-    table_quadro.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('BACKGROUND', (0, 1), (0, -1), colors.lightgrey),
-    ]))
+    table_quadro.setStyle(_TABLE_STYLE_QUADRO)
     
     story.append(table_quadro)
     story.append(Spacer(1, 25))
@@ -342,49 +504,26 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
     # Header tabella carichi
     data_carichi = [['Pos.', 'Denominazione', 'Potenza [kW]', 'Corrente [A]', 'Cos φ', 'Regime', 'Priorità']]
     
-    # Dati carichi
-    for i, c in enumerate(carichi, 1):
-        corrente = round(c.potenza_kw * 1000 / (400 * 1.732 * c.cos_phi), 1)
-        data_carichi.append([
-            f"{i:02d}",
-            c.nome,
-            f"{c.potenza_kw:.1f}",
-            f"{corrente:.1f}",
-            f"{c.cos_phi:.2f}",
-            c.regime.capitalize(),
-            c.priorita.capitalize()
-        ])
+    # Dati carichi: colonne formattate una per volta, righe assemblate con zip
+    potenza_strs = [f"{p:.1f}" for p in carichi['potenza_kw']]
+    corrente_strs = [f"{c:.1f}" for c in correnti]
+    cosphi_strs = [f"{c:.2f}" for c in carichi['cos_phi']]
+    data_carichi += [
+        [f"{i:02d}", n, ps, cs, cps, r.capitalize(), p.capitalize()]
+        for i, (n, ps, cs, cps, r, p) in enumerate(
+            zip(carichi['nome'], potenza_strs, corrente_strs, cosphi_strs,
+                carichi['regime'], carichi['priorita']), 1)
+    ]
     
     # Riga totale
-    tot_potenza = sum(c.potenza_kw for c in carichi)
-    tot_corrente = sum(c.potenza_kw * 1000 / (400 * 1.732 * c.cos_phi) for c in carichi)
+    tot_potenza = carichi['potenza_kw'].sum()
+    tot_corrente = correnti.sum()
     data_carichi.append(['', 'TOTALE GENERALE', f"{tot_potenza:.1f}", f"{tot_corrente:.1f}", '-', '-', '-'])
     
-    table_carichi = Table(data_carichi, colWidths=[0.4*inch, 2.2*inch, 0.8*inch, 0.8*inch, 0.5*inch, 0.8*inch, 0.8*inch])
-    table_carichi.setStyle(TableStyle([
-        # Header
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        # Data
-        ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -2), 8),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('ALIGN', (1, 1), (1, -1), 'LEFT'),  # Nome carico allineato a sinistra
-        # Totale
-        ('BACKGROUND', (0, -1), (-1, -1), colors.darkgrey),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.white),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 9),
-        # Bordi
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
+    # Una sola tabella: ReportLab la divide tra le pagine ripetendo l'header
+    table_carichi = Table(data_carichi, colWidths=[0.4*inch, 2.2*inch, 0.8*inch, 0.8*inch, 0.5*inch, 0.8*inch, 0.8*inch],
+                          repeatRows=1)
+    table_carichi.setStyle(_TABLE_STYLE_CARICHI)
     
     story.append(table_carichi)
     story.append(Spacer(1, 30))
@@ -393,13 +532,6 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
     story.append(HRFlowable(width="100%", thickness=0.5, color=colors.black))
     story.append(Spacer(1, 10))
     
-    footer_style = ParagraphStyle('Footer', 
-                                 parent=styles['Normal'], 
-                                 fontSize=8, 
-                                 textColor=colors.grey,
-                                 fontName='Helvetica',
-                                 alignment=1)  # Centrato
-    
     story.append(Paragraph("Documento generato il " + datetime.now().strftime('%d/%m/%Y alle ore %H:%M'), footer_style))
     story.append(Paragraph("QuadriCAD Pro v1.0 - Prof. de Trizio V.", footer_style))
     story.append(Paragraph("Relazione tecnica conforme alle normative CEI EN 61439", footer_style))
@@ -408,6 +540,202 @@ def genera_pdf_report(progetto_nome, settore, ambiente, ip_grade, carichi,
     doc.build(story)
     buffer.seek(0)
     return buffer
+
+@st.cache_data
+def _progetto_calcoli(carichi_key: Tuple[Tuple, ...], ip_grade: str,
+                      trasf_std: Tuple[int, ...] = _TRASF_STD) -> ProgettoCalcoli:
+    """Tutti i calcoli del progetto, memoizzati sui parametri dei carichi"""
+    pot_inst, fatt_cont, pot_dim = _calc_potenza(carichi_key)
+    
+    # Scelta trasformatore
+    trasf_scelto = prossimo_standard(trasf_std, pot_dim)
+    icc = calcola_corrente_cortocircuito(trasf_scelto) if trasf_scelto is not None else None
+    
+    # Verifica termica
+    volume_quadro = 2.0 * 1.0 * 0.4  # m³ più realistico per ArTu K
+    pot_dissipata_tot = len(carichi_key) * 15 + 80  # stima più precisa
+    verifica_term = verifica_termica_semplificata(pot_dissipata_tot, volume_quadro, ip_grade)
+    
+    return ProgettoCalcoli(pot_inst, fatt_cont, pot_dim, trasf_scelto, icc, verifica_term)
+
+def calcoli_base(carichi_key: Tuple[Tuple, ...], ip_grade: str) -> ProgettoCalcoli:
+    """Risultati del progetto condivisi da tab Calcoli, Componenti e Report.
+    
+    Memorizzati in session_state e letti da _progetto_calcoli solo quando
+    cambiano i carichi o il grado IP.
+    """
+    chiave = (carichi_key, ip_grade)
+    if st.session_state.get('calcoli_key') != chiave:
+        st.session_state.calcoli = _progetto_calcoli(carichi_key, ip_grade)
+        st.session_state.calcoli_key = chiave
+    return st.session_state.calcoli
+
+@st.cache_data
+def _selezione_interruttori(in_generale: float, correnti: np.ndarray, icc: float) -> Tuple[Dict, np.ndarray]:
+    """Interruttore generale e indici degli interruttori di partenza, memoizzati"""
+    return seleziona_interruttore(in_generale, icc), seleziona_interruttori(correnti, icc)
+
+@st.cache_data
+def _df_partenze(carichi_key: Tuple[Tuple, ...], idx_partenze: np.ndarray,
+                 _correnti: np.ndarray) -> pd.DataFrame:
+    """Tabella degli interruttori di partenza (tab Componenti), memoizzata su carichi e selezione.
+    
+    `_correnti` sono quelle già calcolate in main(): escluse dall'hash (prefisso _)
+    perché determinate da `carichi_key`.
+    """
+    carichi = _tabella_da_key(carichi_key)
+    trovati = idx_partenze >= 0
+    idx_ok = idx_partenze[trovati]
+    return pd.DataFrame({
+        "Carico": carichi['nome'].to_numpy()[trovati],
+        "Corrente (A)": np.round(_correnti[trovati], 1),
+        "Interruttore": _BREAKER_MODELLO[idx_ok],
+        "In (A)": _BREAKER_IN_NOM[idx_ok],
+        "Prezzo (€)": _BREAKER_PREZZO[idx_ok],
+    }).astype({"Corrente (A)": "float32", "In (A)": "int16", "Prezzo (€)": "float32"})
+
+@st.cache_data
+def _df_report(carichi_key: Tuple[Tuple, ...], _correnti: np.ndarray) -> pd.DataFrame:
+    """Elenco carichi della relazione tecnica (tab Report), memoizzato sui parametri dei carichi"""
+    carichi = _tabella_da_key(carichi_key)
+    return pd.DataFrame({
+        "Denominazione": carichi['nome'],
+        "Potenza (kW)": carichi['potenza_kw'],
+        "Corrente (A)": np.round(_correnti, 1),
+        "Regime": carichi['regime'],
+        "Priorità": carichi['priorita'],
+    }).astype({"Potenza (kW)": "float32", "Corrente (A)": "float32"})
+
+@st.cache_data
+def _df_carichi(carichi_key: Tuple[Tuple, ...], _correnti: np.ndarray) -> pd.DataFrame:
+    """Tabella riassuntiva dei carichi (tab Carichi), memoizzata sui parametri dei carichi"""
+    carichi = _tabella_da_key(carichi_key)
+    return pd.DataFrame({
+        "Nome": carichi['nome'],
+        "Potenza (kW)": carichi['potenza_kw'],
+        "Cos φ": carichi['cos_phi'],
+        "Regime": carichi['regime'],
+        "h/giorno": carichi['ore_giorno'],
+        "Priorità": carichi['priorita'],
+        "Corrente (A)": np.round(_correnti, 0),
+    })
+
+@st.cache_data
+def _render_relazione_md(progetto, settore, ambiente, ip, pot_inst, fatt_cont, pot_dim,
+                         trasf, icc, verifica: Tuple[str, float], n_carichi: int, data: str) -> str:
+    """Testo Markdown della relazione tecnica (tab Report), memoizzato sui valori calcolati"""
+    esito, margine_pct = verifica
+    return f"""
+    **Progetto:** {progetto}  
+    **Settore:** {settore}  
+    **Ambiente:** {ambiente} ({ip})  
+    **Data:** {data}
+    
+    ### DATI GENERALI
+    - **Potenza installata:** {pot_inst:.0f} kW
+    - **Fattore contemporaneità:** {fatt_cont:.2f}
+    - **Potenza dimensionamento:** {pot_dim:.0f} kW
+    - **Trasformatore:** {trasf} kVA
+    - **Corrente cortocircuito:** {icc:.0f} kA
+    
+    ### VERIFICHE NORMATIVE CEI EN 61439
+    - **Verifica termica:** {esito} (margine {margine_pct:.0f}%)
+    - **Verifica cortocircuito:** ✅ OK (tutti i componenti verificati)
+    - **Grado protezione:** {ip} conforme ambiente
+    
+    ### CARATTERISTICHE QUADRO
+    - **Carpenteria:** ArTu conforme CEI EN 61439-2
+    - **Interruttori:** Serie ABB T/E con protezioni TMD/LSI
+    - **Sistema barre:** Piatte forate per {int(pot_dim*1.8):.0f}A
+    - **Numero partenze:** {n_carichi}
+    """
+
+@st.cache_data
+def _testi_budget(budget_totale: float, costo_totale: float, budget_restante: float) -> Tuple[str, str, str]:
+    """Righe dell'analisi budget (tab Componenti), memoizzate sui tre importi"""
+    return (
+        f"• Budget totale: {budget_totale/1000:.0f}k€",
+        f"• Costo interruttori: {costo_totale/1000:.1f}k€ ({costo_totale/budget_totale*100:.0f}% del totale)",
+        f"• Budget residuo: {budget_restante/1000:.1f}k€ (per carpenteria, cavi, installazione)",
+    )
+
+@st.cache_data
+def _build_chart(carichi_signature: Tuple[Tuple[str, float, str], ...]):
+    """Grafico distribuzione carichi, memoizzato su (nome, potenza, priorità)"""
+    df_chart = pd.DataFrame.from_records(carichi_signature,
+                                         columns=["Carico", "Potenza", "Priorità"])
+    
+    fig = px.bar(df_chart, x="Carico", y="Potenza", color="Priorità",
+                title="Distribuzione Carichi per Priorità")
+    fig.update_layout(xaxis_tickangle=45)
+    return fig
+
+def pdf_digest(*parti) -> str:
+    """Impronta blake2b degli input del report: cambia se cambia un qualsiasi carico"""
+    return hashlib.blake2b(repr(parti).encode("utf-8"), digest_size=16).hexdigest()
+
+@st.cache_data(ttl=3600, max_entries=8, show_spinner="Generazione PDF in corso...")
+def genera_pdf_report_cached(digest: str, _args: Tuple) -> bytes:
+    """PDF del progetto memoizzato sul digest degli input.
+    
+    `_args` sono gli argomenti di genera_pdf_report: esclusi dall'hash di
+    Streamlit (prefisso _) perché già riassunti in `digest`.
+    """
+    return genera_pdf_report(*_args, stili=_pdf_styles()).getvalue()
+
+# ================== SEZIONI UI ==================
+def _errore_trasformatore(pot_dim: float):
+    """Potenza di dimensionamento oltre la taglia massima: niente trasformatore né Icc"""
+    st.error(f"❌ Potenza di dimensionamento {pot_dim:.0f} kW oltre il trasformatore "
+             f"standard più grande ({_TRASF_STD[-1]} kVA): suddividere l'impianto")
+
+def _render_budget(budget_k: int, costo_totale: float):
+    """Analisi budget degli interruttori (tab Componenti)"""
+    budget_totale = budget_k * 1000
+    budget_interruttori = budget_k * 1000 * 0.4  # 40% per interruttori
+    budget_restante = budget_totale - costo_totale
+    
+    st.info(f"📊 **Budget Analysis:**")
+    for testo in _testi_budget(budget_totale, costo_totale, budget_restante):
+        st.info(testo)
+    
+    if costo_totale <= budget_interruttori:
+        st.success(f"✅ **Interruttori OK** - Sotto soglia consigliata 40% budget")
+    else:
+        st.warning(f"⚠️ **Interruttori sopra 40%** - Considera ottimizzazioni")
+    
+    if costo_totale <= budget_totale * 0.6:  # Max 60% del budget totale
+        st.success(f"🎯 **Budget generale rispettato**")
+    else:
+        st.error(f"🚨 **Budget totale in pericolo** - Rivedere specifiche")
+
+def _render_carpenteria(numero_partenze: int, in_generale: float, ip_grade: str):
+    """Scelta carpenteria ArTu (tab Componenti)"""
+    st.subheader("🏗️ Carpenteria ArTu")
+    
+    if numero_partenze <= 6 and in_generale <= 400:
+        carpenteria = "ArTu M - 1 colonna"
+        costo_carp = 8000
+    elif numero_partenze <= 12 and in_generale <= 800:
+        carpenteria = "ArTu K - 1 colonna"
+        costo_carp = 12000
+    else:
+        carpenteria = "ArTu K - 2 colonne"
+        costo_carp = 18000
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Tipo", carpenteria)
+    with col2:
+        st.metric("Grado IP", ip_grade)
+    with col3:
+        st.metric("Costo", f"{costo_carp} €")
+
+def _render_relazione(*args):
+    """Relazione tecnica (tab Report); argomenti come _render_relazione_md"""
+    st.markdown("## 📋 RELAZIONE TECNICA")
+    st.markdown(_render_relazione_md(*args))
+
 # ================== STREAMLIT APP ==================
 def main():
     st.set_page_config(page_title="QuadriCAD Pro", layout="wide")
@@ -416,8 +744,11 @@ def main():
     st.sidebar.title("📋 Menu Progetto")
     
     # Inizializza session state
-    if 'carichi' not in st.session_state:
-        st.session_state.carichi = []
+    if 'carichi_df' not in st.session_state:
+        st.session_state.carichi_df = tabella_carichi()
+    if 'carichi_names' not in st.session_state:
+        # Nomi (minuscoli) dei carichi per il controllo duplicati in O(1)
+        st.session_state.carichi_names = set(st.session_state.carichi_df['nome'].str.lower())
     if 'progetto_nome' not in st.session_state:
         st.session_state.progetto_nome = ""
     
@@ -434,6 +765,11 @@ def main():
     
     budget_k = st.sidebar.number_input("Budget (k€)", min_value=10, max_value=500, value=100)
     
+    # Chiave hashable dei carichi, costruita una volta per rerun
+    carichi = st.session_state.carichi_df
+    carichi_key = tuple(carichi.itertuples(index=False, name=None))
+    correnti = calcola_correnti(carichi['potenza_kw'].to_numpy(), carichi['cos_phi'].to_numpy())
+    
     # ================== TAB PRINCIPALE ==================
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Carichi", "⚡ Calcoli", "🔧 Componenti", "📄 Report"])
     with tab1:
@@ -488,10 +824,12 @@ def main():
                         st.error("⚠️ Inserire denominazione carico")
                     elif potenza <= 0:
                         st.error("⚠️ Potenza deve essere maggiore di 0")
-                    elif any(c.nome.lower() == nome.lower() for c in st.session_state.carichi):
+                    elif nome.strip().lower() in st.session_state.carichi_names:
                         st.error(f"⚠️ Carico '{nome}' già esistente")
                     else:
-                        st.session_state.carichi.append(Carico(nome.strip(), potenza, cos_phi, regime, priorita, ore_giorno))
+                        nuovo = Carico(nome.strip(), potenza, cos_phi, regime, priorita, ore_giorno)
+                        st.session_state.carichi_df = aggiungi_carichi(carichi, [nuovo])
+                        st.session_state.carichi_names.add(nome.strip().lower())
                         st.success(f"✅ Carico '{nome}' aggiunto!")
                         st.rerun()
             
@@ -504,300 +842,209 @@ def main():
         with col2:
             st.subheader("Template Rapidi")
             if st.button("🏭 Officina Meccanica"):
-                template = [
-                    Carico("Centro CNC 1", 45, 0.85, "continuo", "normale", 16),
-                    Carico("Centro CNC 2", 35, 0.85, "continuo", "normale", 16),
-                    Carico("Tornio", 15, 0.8, "intermittente", "normale", 8),
-                    Carico("Compressore", 22, 0.85, "continuo", "critico", 24),
-                    Carico("Illuminazione", 15, 0.9, "continuo", "normale", 12),
-                ]
-                st.session_state.carichi.extend(template)
+                template = _TEMPLATE_OFFICINA
+                st.session_state.carichi_df = aggiungi_carichi(carichi, template)
+                st.session_state.carichi_names.update(c.nome.lower() for c in template)
                 st.success("Template caricato!")
                 st.rerun()
             
             if st.button("🥛 Caseificio"):
-                template = [
-                    Carico("Pastorizzatore", 120, 0.9, "continuo", "critico", 24),
-                    Carico("Gruppo Frigo", 85, 0.85, "continuo", "critico", 24),
-                    Carico("Centrifuga", 75, 0.8, "intermittente", "normale", 6),
-                    Carico("Confezionamento", 35, 0.85, "continuo", "normale", 16),
-                ]
-                st.session_state.carichi.extend(template)
+                template = _TEMPLATE_CASEIFICIO
+                st.session_state.carichi_df = aggiungi_carichi(carichi, template)
+                st.session_state.carichi_names.update(c.nome.lower() for c in template)
                 st.success("Template caricato!")
                 st.rerun()
         
         # Tabella carichi esistenti CON POSSIBILITA' DI CANCELLAZIONE
-        if st.session_state.carichi:
+        if not carichi.empty:
             st.subheader("Carichi Definiti")
             
-            # Creazione tabella con indici per cancellazione
-            for i, carico in enumerate(st.session_state.carichi):
-                col_delete, col_info = st.columns([1, 8])
-                
-                with col_delete:
-                    if st.button("🗑️", key=f"del_{i}", help="Cancella carico"):
-                        st.session_state.carichi.pop(i)
-                        st.rerun()
-                
-                with col_info:
-                    corrente = round(carico.potenza_kw * 1000 / (400 * 1.732 * carico.cos_phi), 1)
-                    st.write(f"**{carico.nome}** - {carico.potenza_kw}kW - {corrente}A - {carico.regime} - {carico.priorita}")
+            # Tabella riassuntiva (unico widget, indipendente dal numero di carichi)
+            df_carichi = _df_carichi(carichi_key, correnti)
             
-            # Tabella riassuntiva
-            df_carichi = pd.DataFrame([
-                {
-                    "Nome": c.nome,
-                    "Potenza (kW)": f"{c.potenza_kw:.1f}",
-                    "Cos φ": f"{c.cos_phi:.2f}",
-                    "Regime": c.regime,
-                    "h/giorno": f"{c.ore_giorno:.0f}",
-                    "Priorità": c.priorita,
-                    "Corrente (A)": round(c.potenza_kw * 1000 / (400 * 1.732 * c.cos_phi), 0)
-                }
-                for c in st.session_state.carichi
-            ])
+            # Formattazione lato browser invece di stringhe pre-formattate
+            st.dataframe(df_carichi, use_container_width=True, column_config={
+                "Potenza (kW)": st.column_config.NumberColumn(format="%.1f"),
+                "Cos φ": st.column_config.NumberColumn(format="%.2f"),
+                "h/giorno": st.column_config.NumberColumn(format="%.0f"),
+                "Corrente (A)": st.column_config.NumberColumn(format="%.0f"),
+            })
             
-            st.dataframe(df_carichi, use_container_width=True)
+            # Cancellazione selettiva: un solo multiselect al posto di un pulsante per riga
+            col_sel, col_del = st.columns([4, 1])
+            with col_sel:
+                selezionati = st.multiselect("Cancella carichi",
+                                             options=list(range(len(carichi))),
+                                             format_func=lambda i: carichi['nome'].iat[i],
+                                             key=f"del_sel_{len(carichi)}")
+            with col_del:
+                if st.button("🗑️ Elimina selezionati", disabled=not selezionati):
+                    rimasti = carichi.drop(index=selezionati).reset_index(drop=True)
+                    st.session_state.carichi_df = rimasti
+                    # Ricostruito invece di discard(): i template possono duplicare un nome
+                    st.session_state.carichi_names = set(rimasti['nome'].str.lower())
+                    st.rerun()
             
             col_clear, col_total = st.columns(2)
             with col_clear:
                 if st.button("🗑️ Cancella Tutti"):
-                    st.session_state.carichi = []
+                    st.session_state.carichi_df = tabella_carichi()
+                    st.session_state.carichi_names.clear()
                     st.rerun()
             with col_total:
-                tot_potenza = sum(c.potenza_kw for c in st.session_state.carichi)
+                tot_potenza = carichi['potenza_kw'].sum()
                 st.metric("Totale Potenza", f"{tot_potenza:.1f} kW")
     
     with tab2:
-        if not st.session_state.carichi:
+        if carichi.empty:
             st.warning("⚠️ Definire prima i carichi nella tab 'Carichi'")
         else:
             st.header("Calcoli Automatici")
             
-            # Calcoli potenza
-            pot_inst, fatt_cont, pot_dim = calcola_potenza_dimensionamento(st.session_state.carichi)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Potenza Installata", f"{pot_inst:.0f} kW")
-            with col2:
-                st.metric("Fattore Contemporaneità", f"{fatt_cont:.2f}")
-            with col3:
-                st.metric("Potenza Dimensionamento", f"{pot_dim:.0f} kW")
-            
-            # Scelta trasformatore
-            trasf_std = [160, 250, 315, 400, 500, 630, 800, 1000, 1250, 1600, 2000, 2500]
-            trasf_scelto = min([t for t in trasf_std if t >= pot_dim])
-            
-            st.success(f"🔌 **Trasformatore consigliato: {trasf_scelto} kVA**")
-            
-            # Corrente di cortocircuito
-            icc = calcola_corrente_cortocircuito(trasf_scelto)
-            st.info(f"⚡ **Corrente di cortocircuito: {icc:.0f} kA**")
-            
-            # Corrente nominale generale
-            in_generale = pot_dim * 1000 / (400 * 1.732 * 0.85)
-            st.info(f"🔄 **Corrente nominale generale: {in_generale:.0f} A**")
-            
-            # Grafico distribuzione carichi - VERSIONE CORRETTA
-            if len(st.session_state.carichi) > 0:
-                df_chart = pd.DataFrame([
-                    {"Carico": c.nome, "Potenza": c.potenza_kw, "Priorità": c.priorita}
-                    for c in st.session_state.carichi
-                ])
+            # Calcoli solo su richiesta: non rieseguiti mentre si inseriscono i carichi
+            if st.button("▶️ Esegui calcoli", key="calc_tab2") or st.session_state.get('tab2_done'):
+                st.session_state.tab2_done = True
+                pot_inst, fatt_cont, pot_dim, trasf_scelto, icc, _ = calcoli_base(carichi_key, ip_grade)
                 
-                fig = px.bar(df_chart, x="Carico", y="Potenza", color="Priorità",
-                            title="Distribuzione Carichi per Priorità")
-                fig.update_layout(xaxis_tickangle=45)
-                st.plotly_chart(fig, use_container_width=True)
-    
-    with tab3:
-        if not st.session_state.carichi:
-            st.warning("⚠️ Completare prima i calcoli")
-        else:
-            st.header("Selezione Componenti")
-            
-            db_interruttori = load_interruttori_db()
-            
-            # Calcoli base
-            pot_inst, fatt_cont, pot_dim = calcola_potenza_dimensionamento(st.session_state.carichi)
-            trasf_std = [160, 250, 315, 400, 500, 630, 800, 1000, 1250, 1600, 2000, 2500]
-            trasf_scelto = min([t for t in trasf_std if t >= pot_dim])
-            icc = calcola_corrente_cortocircuito(trasf_scelto)
-            in_generale = pot_dim * 1000 / (400 * 1.732 * 0.85)
-            
-            # Interruttore generale
-            st.subheader("🔌 Interruttore Generale")
-            int_generale = seleziona_interruttore(in_generale, icc, db_interruttori)
-            
-            if "errore" not in int_generale:
-                col1, col2, col3, col4 = st.columns(4)
+                col1, col2, col3 = st.columns(3)
                 with col1:
-                    st.metric("Modello", int_generale['modello'])
+                    st.metric("Potenza Installata", f"{pot_inst:.0f} kW")
                 with col2:
-                    st.metric("In nominale", f"{int_generale['in_nom']} A")
+                    st.metric("Fattore Contemporaneità", f"{fatt_cont:.2f}")
                 with col3:
-                    st.metric("Icu", f"{int_generale['icu']} kA")
-                with col4:
-                    st.metric("Prezzo", f"{int_generale['prezzo']:.0f} €")
-            else:
-                st.error(int_generale['errore'])
-            
-            # Interruttori partenze
-            st.subheader("⚡ Interruttori Partenze")
-            
-            partenze = []
-            costo_totale = int_generale.get('prezzo', 0)
-            
-            for carico in st.session_state.carichi:
-                corrente_carico = carico.potenza_kw * 1000 / (400 * 1.732 * carico.cos_phi)
-                int_partenza = seleziona_interruttore(corrente_carico, icc, db_interruttori)
-                
-                if "errore" not in int_partenza:
-                    partenze.append({
-                        "Carico": carico.nome,
-                        "Corrente (A)": round(corrente_carico, 1),
-                        "Interruttore": int_partenza['modello'],
-                        "In (A)": int_partenza['in_nom'],
-                        "Prezzo (€)": int_partenza['prezzo']
-                    })
-                    costo_totale += int_partenza['prezzo']
-            
-            if partenze:
-                df_partenze = pd.DataFrame(partenze)
-                st.dataframe(df_partenze, use_container_width=True)
-                
-                st.success(f"💰 **Costo totale interruttori: {costo_totale:.0f} €**")
-                
-                # Verifica budget - VERSIONE CORRETTA
-                budget_totale = budget_k * 1000
-                budget_interruttori = budget_k * 1000 * 0.4  # 40% per interruttori
-                budget_restante = budget_totale - costo_totale
+                    st.metric("Potenza Dimensionamento", f"{pot_dim:.0f} kW")
                 
-                st.info(f"📊 **Budget Analysis:**")
-                st.info(f"• Budget totale: {budget_totale/1000:.0f}k€")
-                st.info(f"• Costo interruttori: {costo_totale/1000:.1f}k€ ({costo_totale/budget_totale*100:.0f}% del totale)")
-                st.info(f"• Budget residuo: {budget_restante/1000:.1f}k€ (per carpenteria, cavi, installazione)")
-                
-                if costo_totale <= budget_interruttori:
-                    st.success(f"✅ **Interruttori OK** - Sotto soglia consigliata 40% budget")
+                # Scelta trasformatore
+                if trasf_scelto is None:
+                    _errore_trasformatore(pot_dim)
                 else:
-                    st.warning(f"⚠️ **Interruttori sopra 40%** - Considera ottimizzazioni")
+                    st.success(f"🔌 **Trasformatore consigliato: {trasf_scelto} kVA**")
+                    
+                    # Corrente di cortocircuito
+                    st.info(f"⚡ **Corrente di cortocircuito: {icc:.0f} kA**")
                 
-                if costo_totale <= budget_totale * 0.6:  # Max 60% del budget totale
-                    st.success(f"🎯 **Budget generale rispettato**")
-                else:
-                    st.error(f"🚨 **Budget totale in pericolo** - Rivedere specifiche")
-            
-            # Carpenteria
-            st.subheader("🏗️ Carpenteria ArTu")
-            
-            numero_partenze = len(st.session_state.carichi) + 1  # +1 per generale
-            
-            if numero_partenze <= 6 and in_generale <= 400:
-                carpenteria = "ArTu M - 1 colonna"
-                costo_carp = 8000
-            elif numero_partenze <= 12 and in_generale <= 800:
-                carpenteria = "ArTu K - 1 colonna"
-                costo_carp = 12000
-            else:
-                carpenteria = "ArTu K - 2 colonne"
-                costo_carp = 18000
+                # Corrente nominale generale
+                in_generale = pot_dim * _K_CURRENT / 0.85
+                st.info(f"🔄 **Corrente nominale generale: {in_generale:.0f} A**")
+                
+                # Grafico distribuzione carichi - VERSIONE CORRETTA
+                if len(carichi) > 0:
+                    chart_signature = tuple(zip(carichi['nome'], carichi['potenza_kw'], carichi['priorita']))
+                    st.plotly_chart(_build_chart(chart_signature), use_container_width=True)
+    
+    with tab3:
+        if carichi.empty:
+            st.warning("⚠️ Completare prima i calcoli")
+        else:
+            st.header("Selezione Componenti")
             
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Tipo", carpenteria)
-            with col2:
-                st.metric("Grado IP", ip_grade)
-            with col3:
-                st.metric("Costo", f"{costo_carp} €")
+            if st.button("▶️ Seleziona componenti", key="calc_tab3") or st.session_state.get('tab3_done'):
+                st.session_state.tab3_done = True
+                # Calcoli base (condivisi con la tab Calcoli)
+                pot_inst, fatt_cont, pot_dim, trasf_scelto, icc, _ = calcoli_base(carichi_key, ip_grade)
+                in_generale = pot_dim * _K_CURRENT / 0.85
+                if trasf_scelto is None:
+                    _errore_trasformatore(pot_dim)
+                else:
+                    # Interruttore generale
+                    st.subheader("🔌 Interruttore Generale")
+                    int_generale, idx_partenze = _selezione_interruttori(in_generale, correnti, icc)
+                    
+                    if "errore" not in int_generale:
+                        col1, col2, col3, col4 = st.columns(4)
+                        with col1:
+                            st.metric("Modello", int_generale['modello'])
+                        with col2:
+                            st.metric("In nominale", f"{int_generale['in_nom']} A")
+                        with col3:
+                            st.metric("Icu", f"{int_generale['icu']} kA")
+                        with col4:
+                            st.metric("Prezzo", f"{int_generale['prezzo']:.0f} €")
+                    else:
+                        st.error(int_generale['errore'])
+                    
+                    # Interruttori partenze
+                    st.subheader("⚡ Interruttori Partenze")
+                    
+                    df_partenze = _df_partenze(carichi_key, idx_partenze, correnti)
+                    costo_totale = int_generale.get('prezzo', 0) + float(df_partenze["Prezzo (€)"].sum())
+                    
+                    if not df_partenze.empty:
+                        st.dataframe(df_partenze, use_container_width=True, column_config={
+                            "Corrente (A)": st.column_config.NumberColumn(format="%.1f"),
+                            "Prezzo (€)": st.column_config.NumberColumn(format="%.0f €"),
+                        })
+                    
+                        st.success(f"💰 **Costo totale interruttori: {costo_totale:.0f} €**")
+                    
+                        # Verifica budget - VERSIONE CORRETTA
+                        _render_budget(budget_k, costo_totale)
+                    
+                    # Carpenteria
+                    _render_carpenteria(len(carichi) + 1, in_generale, ip_grade)  # +1 per generale
     
     with tab4:
-        if not st.session_state.carichi:
+        if carichi.empty:
             st.warning("⚠️ Completare prima la progettazione")
         else:
             st.header("📄 Report Progetto")
             
             # Calcoli finali
-            pot_inst, fatt_cont, pot_dim = calcola_potenza_dimensionamento(st.session_state.carichi)
-            trasf_std = [160, 250, 315, 400, 500, 630, 800, 1000, 1250, 1600, 2000, 2500]
-            trasf_scelto = min([t for t in trasf_std if t >= pot_dim])
-            icc = calcola_corrente_cortocircuito(trasf_scelto)
-            
-            # Verifica termica
-            volume_quadro = 2.0 * 1.0 * 0.4  # m³ più realistico per ArTu K
-            pot_dissipata_tot = len(st.session_state.carichi) * 15 + 80  # stima più precisa
-            verifica_term = verifica_termica_semplificata(pot_dissipata_tot, volume_quadro, ip_grade)
-            
-            # Report finale
-            st.markdown("## 📋 RELAZIONE TECNICA")
-            
-            st.markdown(f"""
-            **Progetto:** {st.session_state.progetto_nome}  
-            **Settore:** {settore}  
-            **Ambiente:** {ambiente} ({ip_grade})  
-            **Data:** {pd.Timestamp.now().strftime('%d/%m/%Y')}
-            
-            ### DATI GENERALI
-            - **Potenza installata:** {pot_inst:.0f} kW
-            - **Fattore contemporaneità:** {fatt_cont:.2f}
-            - **Potenza dimensionamento:** {pot_dim:.0f} kW
-            - **Trasformatore:** {trasf_scelto} kVA
-            - **Corrente cortocircuito:** {icc:.0f} kA
-            
-            ### VERIFICHE NORMATIVE CEI EN 61439
-            - **Verifica termica:** {verifica_term['esito']} (margine {verifica_term['margine_pct']:.0f}%)
-            - **Verifica cortocircuito:** ✅ OK (tutti i componenti verificati)
-            - **Grado protezione:** {ip_grade} conforme ambiente
-            
-            ### CARATTERISTICHE QUADRO
-            - **Carpenteria:** ArTu conforme CEI EN 61439-2
-            - **Interruttori:** Serie ABB T/E con protezioni TMD/LSI
-            - **Sistema barre:** Piatte forate per {int(pot_dim*1.8):.0f}A
-            - **Numero partenze:** {len(st.session_state.carichi)}
-            """)
-            
-            # Lista carichi
-            st.markdown("### ELENCO CARICHI")
-            df_report = pd.DataFrame([
-                {
-                    "Denominazione": c.nome,
-                    "Potenza (kW)": c.potenza_kw,
-                    "Corrente (A)": round(c.potenza_kw * 1000 / (400 * 1.732 * c.cos_phi), 1),
-                    "Regime": c.regime,
-                    "Priorità": c.priorita
-                }
-                for c in st.session_state.carichi
-            ])
-            st.dataframe(df_report, use_container_width=True)
-            
-            # Download report PDF - ORA CORRETTAMENTE DENTRO IL TAB 4
-            if st.button("💾 Genera Report PDF", type="primary"):
-                try:
-                    # Genera PDF
-                    pdf_buffer = genera_pdf_report(
-                        st.session_state.progetto_nome, settore, ambiente, ip_grade,
-                        st.session_state.carichi, pot_inst, fatt_cont, pot_dim, 
-                        trasf_scelto, icc, verifica_term
-                    )
-                    
-                    # Nome file
-                    nome_file = f"Quadro_{st.session_state.progetto_nome or 'Progetto'}_{pd.Timestamp.now().strftime('%Y%m%d')}.pdf"
-                    nome_file = nome_file.replace(" ", "_").replace("/", "_")
-                    
+            pot_inst, fatt_cont, pot_dim, trasf_scelto, icc, verifica_term = calcoli_base(carichi_key, ip_grade)
+            if trasf_scelto is None:
+                _errore_trasformatore(pot_dim)
+            else:
+                oggi = date.today()
+                
+                # Report finale
+                _render_relazione(
+                    st.session_state.progetto_nome, settore, ambiente, ip_grade,
+                    pot_inst, fatt_cont, pot_dim, trasf_scelto, icc,
+                    (verifica_term['esito'], verifica_term['margine_pct']), len(carichi),
+                    oggi.strftime('%d/%m/%Y')
+                )
+                
+                # Lista carichi
+                st.markdown("### ELENCO CARICHI")
+                df_report = _df_report(carichi_key, correnti)
+                st.dataframe(df_report, use_container_width=True, column_config={
+                    "Potenza (kW)": st.column_config.NumberColumn(format="%.1f"),
+                    "Corrente (A)": st.column_config.NumberColumn(format="%.1f"),
+                })
+                
+                # Download report PDF: generato solo su richiesta e memoizzato sul digest
+                pdf_args = (
+                    st.session_state.progetto_nome, settore, ambiente, ip_grade,
+                    carichi, correnti, pot_inst, fatt_cont, pot_dim, 
+                    trasf_scelto, icc, verifica_term
+                )
+                digest = pdf_digest(st.session_state.progetto_nome, settore, ambiente, ip_grade, carichi_key)
+                
+                # Nome file
+                nome_file_base = (st.session_state.progetto_nome or 'Progetto').replace(" ", "_").replace("/", "_")
+                nome_file = f"Quadro_{nome_file_base}_{oggi:%Y%m%d}.pdf"
+                
+                # PDF generato solo nel run del click; (digest, bytes) restano in session_state
+                # e servono il download nei rerun successivi finché non cambiano gli input
+                if st.button("💾 Genera Report PDF", type="primary"):
+                    try:
+                        st.session_state.pdf_report = (digest, genera_pdf_report_cached(digest, pdf_args))
+                    except Exception as e:
+                        st.session_state.pop('pdf_report', None)
+                        st.error(f"❌ Errore generazione PDF: {str(e)}")
+                
+                pdf_report = st.session_state.get('pdf_report')
+                if pdf_report is not None and pdf_report[0] == digest:
                     # Download
                     st.download_button(
                         label="📥 Scarica PDF Report",
-                        data=pdf_buffer,
+                        data=pdf_report[1],
                         file_name=nome_file,
                         mime="application/pdf",
                         type="primary"
                     )
                     
                     st.success("✅ PDF generato! Clicca 'Scarica PDF Report' per salvarlo.")
-                    
-                except Exception as e:
-                    st.error(f"❌ Errore generazione PDF: {str(e)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file